@@ -1,11 +1,13 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import geopandas as gpd
-import plotly.express as px
-import folium
-from streamlit_folium import st_folium
-from shapely import wkb
+import shapely
 import numpy as np
+import pyarrow.parquet as pq
+import glob
+import hashlib
+import os
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -15,110 +17,287 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Nakhon Sawan envelope (lon/lat, padded) used to prune parquet row groups
+NAKHON_SAWAN_BBOX = (99.0, 15.0, 100.9, 16.5)
+
+# On-disk cache of the prepped cultivation frame (bump the version when prep changes)
+CACHE_DIR = '.cache'
+GDF_CACHE_VERSION = '7'
+
+# Only these burn columns are used anywhere in the app
+BURN_COLUMNS = ['id_cultivation', 'Date_Month', 'Burn_area', 'src']
+
+# Cultivation columns the Dashboard needs outside the map (no geometry, no raw usages)
+ATTR_COLUMNS = ['id_cultivation', 'landName', 'ap_en', 'rai', 'minx', 'miny', 'maxx', 'maxy']
+
+# --- Burn Data ---
+def read_burns():
+    # Column projection pushed down into the parquet read
+    burn_df = pd.read_parquet('active_burn.parquet', engine='pyarrow', columns=BURN_COLUMNS)
+    burn_df['Date_Month'] = pd.to_datetime(burn_df['Date_Month'], format='ISO8601', errors='coerce')
+    burn_df['Date_Only'] = burn_df['Date_Month'].dt.date
+    # int32 days since epoch for cheap range filters (NaT -> int32 min, never in range)
+    days = burn_df['Date_Month'].values.astype('datetime64[D]')
+    burn_df['DateDay'] = np.where(
+        np.isnat(days), np.iinfo(np.int32).min, days.astype(np.int64)
+    ).astype(np.int32)
+    burn_df['src'] = burn_df['src'].astype('category')
+    return burn_df
+
+# --- Cultivation Pipeline ---
+def get_gdf_cache_path():
+    # Keyed on the source file and the pipeline version, so either change rebuilds it
+    key = f"{os.path.getmtime('plant_cultivation.parquet')}-{GDF_CACHE_VERSION}"
+    return os.path.join(CACHE_DIR, f"gdf_{hashlib.md5(key.encode()).hexdigest()[:12]}.feather")
+
+def write_gdf_cache(gdf, cache_path):
+    # Atomic write, then drop caches left behind by older versions / source files
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    gdf.to_feather(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+    for stale in glob.glob(os.path.join(CACHE_DIR, 'gdf_*.feather')):
+        if os.path.abspath(stale) != os.path.abspath(cache_path):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+def prep_cultivation_data():
+    # Push the province filter (and the bbox covering, if the file has one) into the read
+    cultivation_cols = pq.read_schema('plant_cultivation.parquet').names
+    read_filters = [('pv_en', '=', 'Nakhon Sawan')] if 'pv_en' in cultivation_cols else None
+    read_bbox = NAKHON_SAWAN_BBOX if 'bbox' in cultivation_cols else None
+
+    try:
+        # Method A: Standard Load
+        gdf = gpd.read_parquet('plant_cultivation.parquet', bbox=read_bbox, filters=read_filters)
+    except Exception:
+        # Method B: Fallback for WKB Geometry
+        df_temp = pd.read_parquet('plant_cultivation.parquet', filters=read_filters)
+        df_temp = df_temp.drop(columns=['bbox'], errors='ignore')
+        # Vectorized decode: one call into GEOS for the whole column
+        df_temp['geometry'] = shapely.from_wkb(df_temp['geometry'].to_numpy())
+        gdf = gpd.GeoDataFrame(df_temp, geometry='geometry')
+
+    # Filter: Nakhon Sawan Only
+    if 'pv_en' in gdf.columns:
+        gdf = gdf[gdf['pv_en'] == 'Nakhon Sawan'].copy()
+
+    # CRS Fix (Ensure WGS84 for Maps)
+    if gdf.crs is None:
+        gdf.set_crs(epsg=4326, inplace=True)
+    elif gdf.crs != "EPSG:4326":
+        gdf = gdf.to_crs(epsg=4326)
+
+    # Per-plot envelopes, so map extents are plain column min/max
+    gdf[['minx', 'miny', 'maxx', 'maxy']] = shapely.bounds(gdf.geometry.values)
+
+    # Simplified geometry for the Folium map (full resolution kept for the mini map)
+    geoms = gdf.geometry.values
+    geom_simple = shapely.simplify(geoms, tolerance=0.0001, preserve_topology=False)
+    gdf['geom_simple'] = gpd.GeoSeries(
+        np.where(shapely.is_empty(geom_simple), geoms, geom_simple), index=gdf.index, crs=gdf.crs
+    )
+        
+    # Convert Area to Numeric
+    gdf['rai'] = pd.to_numeric(gdf['rai'], errors='coerce').fillna(0)
+    
+    # Usages are parsed on demand per farmer (see get_history), not for every plot here
+
+    # District strings -> Categorical (integer codes for filters & groupby);
+    # pv_en is a single constant after the province filter, nothing to gain there
+    if 'ap_en' in gdf.columns:
+        gdf['ap_en'] = gdf['ap_en'].astype('category')
+
+    return gdf
+
 # --- Robust Data Loading Function ---
-@st.cache_data
+# cache_resource: one shared, read-only copy instead of unpickling the frames on every call
+@st.cache_resource
 def load_and_prep_data():
     # 1. Load Burn Data
     try:
-        burn_df = pd.read_parquet('active_burn.parquet')
-        burn_df['Date_Month'] = pd.to_datetime(burn_df['Date_Month'], errors='coerce')
-        burn_df['Date_Only'] = burn_df['Date_Month'].dt.date
+        burn_df = read_burns()
     except Exception as e:
         st.error(f"❌ Error reading 'active_burn.parquet': {e}")
         st.stop()
 
-    # 2. Load Cultivation Data
+    # 2. Load Cultivation Data (disk cache survives process restarts)
     try:
+        cache_path = get_gdf_cache_path()
+        gdf = None
         try:
-            # Method A: Standard Load
-            gdf = gpd.read_parquet('plant_cultivation.parquet')
+            # Fast path: prepped frame from a previous process
+            gdf = gpd.read_feather(cache_path)
+        except FileNotFoundError:
+            pass  # Normal miss: first run for this source file / pipeline version
         except Exception:
-            # Method B: Fallback for WKB Geometry
-            df_temp = pd.read_parquet('plant_cultivation.parquet')
-            df_temp['geometry'] = df_temp['geometry'].apply(lambda x: wkb.loads(bytes(x)))
-            gdf = gpd.GeoDataFrame(df_temp, geometry='geometry')
-
-        # Filter: Nakhon Sawan Only
-        if 'pv_en' in gdf.columns:
-            gdf = gdf[gdf['pv_en'] == 'Nakhon Sawan'].copy()
-        
-        # CRS Fix (Ensure WGS84 for Maps)
-        if gdf.crs is None:
-            gdf.set_crs(epsg=4326, inplace=True)
-        elif gdf.crs != "EPSG:4326":
-            gdf = gdf.to_crs(epsg=4326)
-            
-        # Convert Area to Numeric
-        gdf['rai'] = pd.to_numeric(gdf['rai'], errors='coerce').fillna(0)
-        
-        # --- PARSE LATEST USAGE (For Main Map & Filters) ---
-        def parse_latest_usage(usage_input):
-            # Ensure input is a list
-            if isinstance(usage_input, np.ndarray):
-                usage_list = usage_input.tolist()
-            elif isinstance(usage_input, list):
-                usage_list = usage_input
-            else:
-                usage_list = []
-
-            default_info = {
-                'Rice_Variety': 'Unknown',
-                'Rice_Type': 'Unknown',
-                'Plant_Date': None,
-                'Harvest_Date': None
-            }
-            
-            if usage_list:
-                # 1. Flatten list to sort by date
-                cycles = []
-                for item in usage_list:
-                    if isinstance(item, dict):
-                        cycle = {}
-                        cycle['Plant_Date'] = item.get('plantDate')
-                        cycle['Harvest_Date'] = item.get('harvestDate')
-                        if 'extension' in item:
-                            cycle['Rice_Variety'] = item['extension'].get('riceVariety', 'Unknown')
-                            cycle['Rice_Type'] = item['extension'].get('riceType', 'Unknown')
-                        cycles.append(cycle)
-                
-                if cycles:
-                    df_cycles = pd.DataFrame(cycles)
-                    df_cycles['Plant_Date'] = pd.to_datetime(df_cycles['Plant_Date'], errors='coerce')
-                    
-                    # Sort by Plant Date Descending (Latest first)
-                    latest = df_cycles.sort_values('Plant_Date', ascending=False).iloc[0]
-                    
-                    return pd.Series({
-                        'Rice_Variety': latest.get('Rice_Variety'),
-                        'Rice_Type': latest.get('Rice_Type'),
-                        'Plant_Date': latest.get('Plant_Date'),
-                        'Harvest_Date': latest.get('Harvest_Date')
-                    })
-            
-            return pd.Series(default_info)
+            # Unreadable (e.g. truncated) cache: discard it and rebuild from the parquet
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
 
-        # Apply parsing (Cached)
-        if 'usages' in gdf.columns:
-            usage_data = gdf['usages'].apply(parse_latest_usage)
-            gdf = pd.concat([gdf, usage_data], axis=1)
-            
-            # Convert derived dates
-            gdf['Plant_Date'] = pd.to_datetime(gdf['Plant_Date'], errors='coerce')
-            gdf['Harvest_Date'] = pd.to_datetime(gdf['Harvest_Date'], errors='coerce')
+        if gdf is None:
+            gdf = prep_cultivation_data()
+            try:
+                write_gdf_cache(gdf, cache_path)
+            except Exception:
+                pass  # Disk cache is best effort (e.g. read-only deploys)
 
     except Exception as e:
         st.error(f"❌ Error reading 'plant_cultivation.parquet': {e}")
         st.stop()
+
+    # Hash index: id_cultivation -> row position (O(1) lookups)
+    id_to_pos = pd.Series(np.arange(len(gdf)), index=gdf['id_cultivation'].values)
     
-    # 3. Merge for Analysis
-    merged_df = pd.merge(gdf, burn_df, on='id_cultivation', how='left')
-    merged_df['Burn_area'] = merged_df['Burn_area'].fillna(0)
-    merged_df['src'] = merged_df['src'].fillna('No Burn')
-    
-    return gdf, burn_df, merged_df
+    # Merging is done per query, after the burns are filtered
+    return gdf, burn_df, id_to_pos
+
+# --- Cached Lookups ---
+@st.cache_data
+def get_attributes():
+    # Built once: only the light columns the Dashboard KPIs, charts and map extent use
+    gdf, _, _ = load_and_prep_data()
+    return pd.DataFrame(gdf[ATTR_COLUMNS])
+
+@st.cache_data
+def get_burn_index():
+    # Built once: burns indexed by id_cultivation for .loc lookups
+    _, burn_df, _ = load_and_prep_data()
+    return burn_df.set_index('id_cultivation')
+
+@st.cache_data
+def burn_cube():
+    # Built once: (DateDay, id_cultivation) x src burn totals, sorted for date-range slicing
+    _, burn_df, _ = load_and_prep_data()
+    cube = burn_df.groupby(['DateDay', 'src', 'id_cultivation'], observed=True)['Burn_area'].sum()
+    return cube.unstack('src', fill_value=0).sort_index()
+
+def load_burns(start, end, srcs: tuple):
+    # In-memory mask on the shared frame: int32 day range + instrument, no parquet re-read
+    _, burn_df, _ = load_and_prep_data()
+    s = np.datetime64(start, 'D').astype(np.int64)
+    e = np.datetime64(end, 'D').astype(np.int64)
+    day = burn_df['DateDay'].to_numpy()
+    mask = (day >= s) & (day <= e)
+    # Rows without an instrument never reach burn_cube(), so drop them here too
+    # to keep the map / burned-plot KPIs in line with the area KPI and charts
+    mask &= (burn_df['src'].isin(srcs) if srcs else burn_df['src'].notna()).to_numpy()
+    return burn_df[mask]
+
+@st.cache_data(max_entries=128)
+def get_history(selected_id: int):
+    # Returns None when the plot has no usage list at all,
+    # or a pre-sorted, display-formatted DataFrame (possibly empty)
+    gdf, _, id_to_pos = load_and_prep_data()
+    pos = id_to_pos.get(selected_id)
+    if pos is None:
+        return None
+    raw_usages = gdf['usages'].iloc[pos]
+
+    # Ensure it's a list (Fix for Numpy Arrays)
+    if isinstance(raw_usages, np.ndarray):
+        raw_usages_list = raw_usages.tolist()
+    elif isinstance(raw_usages, list):
+        raw_usages_list = raw_usages
+    else:
+        raw_usages_list = []
+
+    if not raw_usages_list:
+        return None
+
+    history_list = []
+    for item in raw_usages_list:
+        if isinstance(item, dict):
+            ext = item.get('extension') or {}
+            history_list.append({
+                'Plant Date': item.get('plantDate'),
+                'Harvest Date': item.get('harvestDate'),
+                'Season': ext.get('seasonName', 'N/A'),
+                'Variety': ext.get('riceVariety', 'N/A'),
+                'Type': ext.get('riceType', 'N/A'),
+            })
+
+    history_df = pd.DataFrame(history_list)
+    if history_df.empty:
+        return history_df
+
+    # Sort by Plant Date descending
+    history_df['Plant Date'] = pd.to_datetime(history_df['Plant Date'], format='ISO8601', errors='coerce', utc=True)
+    history_df = history_df.sort_values('Plant Date', ascending=False)
+
+    # Format for display
+    history_df['Plant Date'] = history_df['Plant Date'].dt.strftime('%Y-%m-%d')
+    history_df['Harvest Date'] = pd.to_datetime(
+        history_df['Harvest Date'], format='ISO8601', errors='coerce', utc=True
+    ).dt.strftime('%Y-%m-%d')
+
+    return history_df
+
+# --- Cached Map Rendering ---
+@st.cache_data(max_entries=32)
+def build_map_html(district: str, burned_ids_frozen: frozenset, bounds: tuple) -> str:
+    # Rendered once per filter result; reruns with the same key skip GeoJSON serialization
+    gdf, _, _ = load_and_prep_data()
+    if district != 'All Districts':
+        gdf = gdf.loc[gdf['ap_en'] == district]
+
+    import folium  # Lazy: only needed once a map is actually rendered
+
+    minx, miny, maxx, maxy = bounds
+    m = folium.Map(location=[(miny+maxy)/2, (minx+maxx)/2], zoom_start=10, tiles="CartoDB positron")
+
+    def style_fn(feature):
+        color = '#e74c3c' if feature['properties']['id_cultivation'] in burned_ids_frozen else '#2ecc71'
+        return {'fillColor': color, 'color': 'black', 'weight': 0.5, 'fillOpacity': 0.6}
+
+    # Map columns (simplified geometry keeps the GeoJSON payload small)
+    cols = ['geom_simple', 'id_cultivation', 'landName', 'ap_en', 'rai']
+    map_data = gpd.GeoDataFrame(
+        gdf[cols].rename(columns={'geom_simple': 'geometry'}),
+        geometry='geometry', crs=gdf.crs
+    )
+
+    folium.GeoJson(
+        map_data,
+        style_function=style_fn,
+        tooltip=folium.GeoJsonTooltip(fields=['landName', 'ap_en', 'rai', 'id_cultivation'])
+    ).add_to(m)
+    return m.get_root().render()
+
+@st.cache_data(max_entries=32)
+def render_map_png(district: str, burned_ids_frozen: frozenset, bounds: tuple) -> bytes:
+    # Static snapshot of the burn map: one PNG per filter result instead of a Leaflet payload
+    from io import BytesIO
+    from matplotlib.figure import Figure  # Lazy; Figure (not pyplot) is safe across sessions
+
+    gdf, _, _ = load_and_prep_data()
+    if district != 'All Districts':
+        gdf = gdf.loc[gdf['ap_en'] == district]
+    gdf_sub = gpd.GeoDataFrame(geometry=gdf['geom_simple'].values, crs=gdf.crs)
+    burned = gdf['id_cultivation'].isin(list(burned_ids_frozen)).to_numpy()
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    gdf_sub.plot(
+        ax=ax, color=np.where(burned, '#e74c3c', '#2ecc71'),
+        edgecolor='face', linewidth=0.5, alpha=0.8
+    )
+    minx, miny, maxx, maxy = bounds
+    ax.set_xlim(minx, maxx)
+    ax.set_ylim(miny, maxy)
+    ax.set_axis_off()
+
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    return buf.getvalue()
 
 # --- Load Data ---
-gdf_cultivation, df_burn_raw, df_merged = load_and_prep_data()
+gdf_cultivation, df_burn_raw, id_to_pos = load_and_prep_data()
 
 # --- SIDEBAR NAVIGATION ---
 st.sidebar.title("📱 Navigation")
@@ -153,30 +332,44 @@ if page == "📊 Regional Dashboard":
     selected_inst = st.sidebar.multiselect("🛰️ Instrument", available_inst, default=available_inst)
 
     # --- FILTER LOGIC ---
+    # Light attribute columns only: the map builds its own geometry from the cached frame
+    attrs_df = get_attributes()
+    # Read-only view: no .copy() needed
     if selected_district != 'All Districts':
-        dashboard_gdf = gdf_cultivation[gdf_cultivation['ap_en'] == selected_district].copy()
+        dashboard_attrs = attrs_df.loc[attrs_df['ap_en'] == selected_district]
     else:
-        dashboard_gdf = gdf_cultivation.copy()
+        dashboard_attrs = attrs_df
+
+    # Date + instrument filters applied in memory to the loaded burns
+    filtered_burns = load_burns(start_date, end_date, tuple(selected_inst))
+
+    # Burned plots straight from the (small) filtered burns, limited to the plots on screen
+    # so the map/PNG cache key does not change with burns outside the district
+    burning = filtered_burns.loc[filtered_burns['Burn_area'] > 0, 'id_cultivation'].to_numpy()
+    burned_ids = frozenset(np.intersect1d(burning, dashboard_attrs['id_cultivation'].to_numpy()).tolist())
 
-    filtered_burns = df_burn_raw[
-        (df_burn_raw['Date_Only'] >= start_date) & 
-        (df_burn_raw['Date_Only'] <= end_date)
-    ]
+    # Pre-aggregated burns for the charts: slice the cube instead of re-grouping raw rows
+    s_day = np.datetime64(start_date, 'D').astype(np.int64)
+    e_day = np.datetime64(end_date, 'D').astype(np.int64)
+    burn_window = burn_cube().loc[s_day:e_day]
     if selected_inst:
-        filtered_burns = filtered_burns[filtered_burns['src'].isin(selected_inst)]
+        burn_window = burn_window.loc[:, burn_window.columns.isin(selected_inst)]
+    burn_window = burn_window[burn_window.index.get_level_values('id_cultivation').isin(dashboard_attrs['id_cultivation'])]
 
-    dashboard_merged = pd.merge(dashboard_gdf, filtered_burns, on='id_cultivation', how='left')
-    dashboard_merged['Burn_area'] = dashboard_merged['Burn_area'].fillna(0)
-    dashboard_merged['src'] = dashboard_merged['src'].fillna('No Burn')
+    burn_by_src = burn_window.sum()
+    burn_by_id = burn_window.sum(axis=1).groupby(level='id_cultivation').sum()
+    plot_burns = dashboard_attrs[['id_cultivation', 'landName', 'ap_en']].assign(
+        Burn_area=dashboard_attrs['id_cultivation'].map(burn_by_id).fillna(0)
+    )
 
     # --- KPI METRICS ---
     col1, col2, col3, col4 = st.columns(4)
-    with col1: st.metric("Total Plots", f"{len(dashboard_gdf):,}")
-    with col2: st.metric("Total Area", f"{dashboard_gdf['rai'].sum():,.0f} Rai")
-    with col3: st.metric("Burned Area (Filtered)", f"{dashboard_merged['Burn_area'].sum():,.2f} Rai")
+    with col1: st.metric("Total Plots", f"{len(dashboard_attrs):,}")
+    with col2: st.metric("Total Area", f"{dashboard_attrs['rai'].sum():,.0f} Rai")
+    with col3: st.metric("Burned Area (Filtered)", f"{burn_window.to_numpy().sum():,.2f} Rai")
     with col4:
-        burned_count = dashboard_merged[dashboard_merged['Burn_area'] > 0]['id_cultivation'].nunique()
-        pct = (burned_count / len(dashboard_gdf) * 100) if len(dashboard_gdf) > 0 else 0
+        burned_count = len(burned_ids)
+        pct = (burned_count / len(dashboard_attrs) * 100) if len(dashboard_attrs) > 0 else 0
         st.metric("% Plots with Fire", f"{pct:.1f}%")
 
     st.divider()
@@ -186,33 +379,27 @@ if page == "📊 Regional Dashboard":
     
     with c_map:
         st.subheader("📍 Burn Map")
-        if not dashboard_gdf.empty:
-            minx, miny, maxx, maxy = dashboard_gdf.total_bounds
-            m = folium.Map(location=[(miny+maxy)/2, (minx+maxx)/2], zoom_start=10, tiles="CartoDB positron")
-            
-            burned_ids = set(dashboard_merged[dashboard_merged['Burn_area'] > 0]['id_cultivation'])
-            
-            def style_fn(feature):
-                color = '#e74c3c' if feature['properties']['id_cultivation'] in burned_ids else '#2ecc71'
-                return {'fillColor': color, 'color': 'black', 'weight': 0.5, 'fillOpacity': 0.6}
-            
-            # Map columns
-            cols = ['geometry', 'id_cultivation', 'landName', 'ap_en', 'rai']
-            map_data = dashboard_gdf[cols].copy()
-            
-            folium.GeoJson(
-                map_data,
-                style_function=style_fn,
-                tooltip=folium.GeoJsonTooltip(fields=['landName', 'ap_en', 'rai', 'id_cultivation'])
-            ).add_to(m)
-            st_folium(m, height=500, use_container_width=True)
+        if not dashboard_attrs.empty:
+            minx, miny = dashboard_attrs[['minx', 'miny']].min()
+            maxx, maxy = dashboard_attrs[['maxx', 'maxy']].max()
+            bounds = (float(minx), float(miny), float(maxx), float(maxy))
+
+            # Static PNG by default; the Leaflet map is opt-in
+            if st.toggle("🔍 Interactive", value=False):
+                map_html = build_map_html(selected_district, burned_ids, bounds)
+                components.html(map_html, height=500)
+            else:
+                st.image(render_map_png(selected_district, burned_ids, bounds), use_container_width=True)
             
+    # Lazy: plotly is only loaded once the charts are reached
+    import plotly.express as px
+
     with c_chart:
         st.subheader("🛰️ Source Analysis")
-        burn_events = dashboard_merged[dashboard_merged['Burn_area'] > 0]
-        if not burn_events.empty:
+        src_burn = burn_by_src[burn_by_src > 0]
+        if not src_burn.empty:
             fig = px.bar(
-                burn_events.groupby('src')['Burn_area'].sum().reset_index(),
+                src_burn.rename_axis('src').reset_index(name='Burn_area'),
                 x='src', y='Burn_area', color='src',
                 title="Burn Area by Instrument"
             )
@@ -222,16 +409,23 @@ if page == "📊 Regional Dashboard":
 
     st.subheader("📈 Deep Dive")
     t1, t2 = st.tabs(["🔥 Top Districts", "🚜 Top Burners"])
+
+    # Zero-burn plots add nothing to a sum, so both rankings group only burning plots
+    burn_events = plot_burns[plot_burns['Burn_area'] > 0]
     
     with t1:
-        if not dashboard_merged.empty:
-            dist_burn = dashboard_merged.groupby('ap_en')['Burn_area'].sum().reset_index().sort_values('Burn_area', ascending=False)
+        if not burn_events.empty:
+            dist_burn = burn_events.groupby('ap_en', observed=True)['Burn_area'].sum().reset_index().sort_values('Burn_area', ascending=False)
             st.plotly_chart(px.bar(dist_burn, x='ap_en', y='Burn_area', color='Burn_area', color_continuous_scale='Reds'), use_container_width=True)
+        else:
+            st.info("No burns in selected range.")
             
     with t2:
-        if not dashboard_merged.empty:
-            top_farmers = dashboard_merged.groupby(['landName', 'ap_en'])['Burn_area'].sum().reset_index().sort_values('Burn_area', ascending=False).head(10)
+        if not burn_events.empty:
+            top_farmers = burn_events.groupby(['landName', 'ap_en'], observed=True)['Burn_area'].sum().reset_index().sort_values('Burn_area', ascending=False).head(10)
             st.plotly_chart(px.bar(top_farmers, x='Burn_area', y='landName', orientation='h', color='Burn_area', color_continuous_scale='Reds'), use_container_width=True)
+        else:
+            st.info("No burns in selected range.")
 
 # ==========================================
 # PAGE 2: FARMER INSPECTOR
@@ -249,21 +443,26 @@ elif page == "👨‍🌾 Farmer Inspector":
     
     if search_mode == "🔥 Top Burners List":
         # Sort by Total Burn Area
-        farmer_ranks = df_merged.groupby(['landName', 'id_cultivation'])['Burn_area'].sum().reset_index()
+        burn_totals = df_burn_raw.groupby('id_cultivation')['Burn_area'].sum()
+        farmer_ranks = pd.DataFrame(gdf_cultivation[['landName', 'id_cultivation']])
+        farmer_ranks['Burn_area'] = farmer_ranks['id_cultivation'].map(burn_totals).fillna(0)
         farmer_ranks = farmer_ranks.sort_values('Burn_area', ascending=False)
         
-        farmer_ranks['label'] = farmer_ranks.apply(
-            lambda x: f"{x['landName']} (ID: {x['id_cultivation']}) - Total Burn: {x['Burn_area']:.2f} Rai", axis=1
+        # Vectorized label build; keep the id alongside instead of parsing it back out
+        labels = (
+            farmer_ranks['landName'].astype(str) + ' (ID: ' + farmer_ranks['id_cultivation'].astype(str)
+            + ') - Total Burn: ' + farmer_ranks['Burn_area'].map('{:.2f}'.format) + ' Rai'
         )
+        label_to_id = dict(zip(labels, farmer_ranks['id_cultivation']))
         
-        selected_label = st.sidebar.selectbox("Select Farmer", farmer_ranks['label'])
-        selected_id = int(selected_label.split("(ID: ")[1].split(")")[0])
+        selected_label = st.sidebar.selectbox("Select Farmer", labels)
+        selected_id = int(label_to_id[selected_label])
         
     else: # Search by ID (Lookup in Cultivation Data)
         input_id = st.sidebar.number_input("Enter Farmer ID", value=0, step=1)
         if input_id > 0:
             # Check if this ID exists in the updated plant_cultivation file
-            if input_id in gdf_cultivation['id_cultivation'].values:
+            if input_id in id_to_pos.index:
                 selected_id = input_id
             else:
                 st.sidebar.error(f"❌ ID {input_id} not found in plant_cultivation.parquet.")
@@ -274,8 +473,14 @@ elif page == "👨‍🌾 Farmer Inspector":
     
     # --- GET SPECIFIC DATA ---
     if selected_id is not None:
-        farmer_geo = gdf_cultivation[gdf_cultivation['id_cultivation'] == selected_id].iloc[0]
-        farmer_burns = df_merged[(df_merged['id_cultivation'] == selected_id) & (df_merged['Burn_area'] > 0)]
+        pos = id_to_pos.get(selected_id)
+        farmer_geo = gdf_cultivation.iloc[pos]
+        burn_idx = get_burn_index()
+        if selected_id in burn_idx.index:
+            farmer_burns = burn_idx.loc[[selected_id]]
+            farmer_burns = farmer_burns[farmer_burns['Burn_area'] > 0]
+        else:
+            farmer_burns = burn_idx.iloc[0:0]
         
         # Metrics
         with st.container():
@@ -293,50 +498,19 @@ elif page == "👨‍🌾 Farmer Inspector":
         with c_left:
             st.subheader("🌱 Cultivation History")
             
-            # --- ROBUST CULTIVATION HISTORY PARSING ---
-            raw_usages = farmer_geo['usages']
-            
-            # Ensure it's a list (Fix for Numpy Arrays)
-            if isinstance(raw_usages, np.ndarray):
-                raw_usages_list = raw_usages.tolist()
-            elif isinstance(raw_usages, list):
-                raw_usages_list = raw_usages
-            else:
-                raw_usages_list = []
-
-            history_df = pd.DataFrame() # Initialize empty
-            if raw_usages_list:
-                history_list = []
-                for item in raw_usages_list:
-                    if isinstance(item, dict):
-                        cycle = {
-                            'Plant Date': item.get('plantDate'),
-                            'Harvest Date': item.get('harvestDate'),
-                            'Season': item.get('extension', {}).get('seasonName', 'N/A'),
-                            'Variety': item.get('extension', {}).get('riceVariety', 'N/A'),
-                            'Type': item.get('extension', {}).get('riceType', 'N/A'),
-                        }
-                        history_list.append(cycle)
-                
-                if history_list:
-                    history_df = pd.DataFrame(history_list)
-                    # Sort by Plant Date descending
-                    history_df['Plant Date'] = pd.to_datetime(history_df['Plant Date'], errors='coerce')
-                    history_df = history_df.sort_values('Plant Date', ascending=False)
-                    
-                    # Format for display
-                    history_df['Plant Date'] = history_df['Plant Date'].dt.strftime('%Y-%m-%d')
-                    
-                    if 'Harvest Date' in history_df.columns:
-                        history_df['Harvest Date'] = pd.to_datetime(history_df['Harvest Date'], errors='coerce').dt.strftime('%Y-%m-%d')
-                    
-                    st.dataframe(history_df, use_container_width=True, hide_index=True)
-                else:
-                    st.info("Usage data found, but format was empty.")
-            else:
+            # --- CULTIVATION HISTORY (Cached per farmer) ---
+            history_df = get_history(int(selected_id))
+
+            if history_df is None:
                 st.warning("No detailed cultivation history available.")
+            elif history_df.empty:
+                st.info("Usage data found, but format was empty.")
+            else:
+                st.dataframe(history_df, use_container_width=True, hide_index=True)
             
             st.markdown("#### Plot Geometry")
+            import folium
+            from streamlit_folium import st_folium
             bounds = farmer_geo.geometry.bounds
             center = [(bounds[1]+bounds[3])/2, (bounds[0]+bounds[2])/2]
             mini_map = folium.Map(location=center, zoom_start=13, tiles="CartoDB positron")
@@ -345,6 +519,7 @@ elif page == "👨‍🌾 Farmer Inspector":
             
         with c_right:
             st.subheader("🔥 Burn History Analysis")
+            import plotly.express as px
             
             if not farmer_burns.empty:
                 fig = px.bar(
@@ -353,19 +528,15 @@ elif page == "👨‍🌾 Farmer Inspector":
                 )
                 
                 # Add Harvest Markers
-                if not history_df.empty:
-                    for _, row in history_df.iterrows():
-                        h_date_str = row['Harvest Date']
-                        if pd.notnull(h_date_str) and h_date_str != "NaT" and h_date_str is not None:
-                            try:
-                                h_dt = pd.to_datetime(h_date_str)
-                                fig.add_vline(
-                                    x=h_dt.timestamp() * 1000, 
-                                    line_dash="dash", line_color="green", opacity=0.5,
-                                    annotation_text=f"Harvest"
-                                )
-                            except:
-                                pass
+                if history_df is not None and not history_df.empty:
+                    # Parse the display strings once as a column, not per row
+                    harvest_dates = pd.to_datetime(history_df['Harvest Date'], format='%Y-%m-%d', errors='coerce').dropna()
+                    for h_dt in harvest_dates:
+                        fig.add_vline(
+                            x=h_dt.timestamp() * 1000, 
+                            line_dash="dash", line_color="green", opacity=0.5,
+                            annotation_text=f"Harvest"
+                        )
                             
                 st.plotly_chart(fig, use_container_width=True)
                 st.dataframe(farmer_burns[['Date_Month', 'src', 'Burn_area']].sort_values('Date_Month', ascending=False), use_container_width=True)